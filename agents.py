@@ -3,27 +3,67 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from crewai import Agent
-from langchain_openai import ChatOpenAI
+from crewai import Agent, LLM
 from tools import search_tool, read_financial_document, analyze_investment_opportunities, assess_financial_risk
 
+# CrewAI verbose mode writes rich console output for every LLM/tool step; opt in with CREW_VERBOSE=1
+VERBOSE = os.getenv("CREW_VERBOSE", "0") == "1"
+
 ### Loading LLM
-# Use free OpenAI model for testing
-if os.getenv("OPENAI_API_KEY"):
-    llm = ChatOpenAI(
-        model="gpt-3.5-turbo",  # Free model for testing
-        temperature=0.1,
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-else:
-    llm = None  # Will use CrewAI default LLM
+# Model is routed through CrewAI's LiteLLM-backed LLM wrapper so the provider can be
+# swapped via LLM_MODEL (e.g. "anthropic/claude-3-5-sonnet-20240620", "gemini/gemini-1.5-pro")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")  # Free model for testing
+
+# Optional OpenAI-compatible server, e.g. a local vLLM serving an FP8-quantized model:
+#   vllm serve neuralmagic/Meta-Llama-3.1-70B-Instruct-FP8 --port 8001
+#   LLM_MODEL=hosted_vllm/neuralmagic/Meta-Llama-3.1-70B-Instruct-FP8 LLM_BASE_URL=http://localhost:8001/v1
+# Only OpenAI-compatible model routes are sent there; other providers keep their own endpoint.
+OPENAI_COMPATIBLE_PREFIXES = ("hosted_vllm/", "openai/")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") if LLM_MODEL.startswith(OPENAI_COMPATIBLE_PREFIXES) else None
+
+# Providers that need an explicit cache checkpoint on the static system prompt.
+# OpenAI caches prompt prefixes automatically as long as the prefix is byte-stable.
+CACHE_CONTROL_PROVIDERS = ("anthropic/", "claude", "gemini/", "vertex_ai/")
+
+def build_llm():
+    """Build the shared LLM, or None to fall back to the CrewAI default LLM"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    llm_kwargs = {"model": LLM_MODEL, "temperature": 0.1}
+
+    if LLM_BASE_URL:
+        # Self-hosted servers usually accept any key
+        llm_kwargs["base_url"] = LLM_BASE_URL
+        llm_kwargs["api_key"] = api_key or "EMPTY"
+    elif LLM_MODEL.startswith(CACHE_CONTROL_PROVIDERS):
+        # Agent role/backstory/goal and the tool schemas all live in the system message,
+        # so one checkpoint there lets the provider reuse the prefill across crew turns
+        llm_kwargs["cache_control_injection_points"] = [{"location": "message", "role": "system"}]
+    elif "/" in LLM_MODEL and not LLM_MODEL.startswith("openai/"):
+        pass  # LiteLLM reads the provider's own key, e.g. ANTHROPIC_API_KEY or GEMINI_API_KEY
+    elif api_key:
+        llm_kwargs["api_key"] = api_key
+    else:
+        return None  # Will use CrewAI default LLM
+
+    return LLM(**llm_kwargs)
+
+llm = build_llm()
+
+# Per-agent request rate cap (requests/minute); 0 removes it. Batching happens server-side:
+# backends with continuous batching (vLLM, hosted APIs) batch whatever requests are in flight,
+# so the parallel crews and worker processes only help if the cap lets their calls overlap.
+AGENT_MAX_RPM = int(os.getenv("AGENT_MAX_RPM", "10")) or None
+
+# Agent goals and backstories are kept free of per-request placeholders such as {query}
+# so the system prompt is byte-identical across requests and stays cacheable.
+# Per-request inputs are interpolated into the task descriptions (the user turn) instead.
 
 # Creating an Experienced Financial Analyst agent
 financial_analyst = Agent(
     role="Senior Financial Analyst",
-    goal="Provide comprehensive and accurate financial analysis based on the query: {query}",
-    verbose=True,
-    memory=True,
+    goal="Provide comprehensive and accurate financial analysis that directly answers the user's query",
+    verbose=VERBOSE,
+    memory=False,
     backstory=(
         "You are a seasoned financial analyst with over 15 years of experience in corporate finance, "
         "investment analysis, and financial reporting. You have worked with major investment firms "
@@ -35,16 +75,16 @@ financial_analyst = Agent(
         tools=[read_financial_document] if search_tool is None else [read_financial_document, search_tool],
     llm=llm if llm else None,
     max_iter=3,
-    max_rpm=10,
-    allow_delegation=True
+    max_rpm=AGENT_MAX_RPM,
+    allow_delegation=False
 )
 
 # Creating a document verifier agent
 verifier = Agent(
     role="Financial Document Verification Specialist",
     goal="Thoroughly verify and validate financial documents for accuracy, completeness, and authenticity",
-    verbose=True,
-    memory=True,
+    verbose=VERBOSE,
+    memory=False,
     backstory=(
         "You are a financial document verification expert with extensive experience in regulatory "
         "compliance and document authentication. You have worked in audit firms and regulatory "
@@ -57,15 +97,15 @@ verifier = Agent(
         tools=[read_financial_document],
     llm=llm if llm else None,
     max_iter=2,
-    max_rpm=10,
-    allow_delegation=True
+    max_rpm=AGENT_MAX_RPM,
+    allow_delegation=False
 )
 
 investment_advisor = Agent(
     role="Investment Advisory Specialist",
     goal="Provide evidence-based investment recommendations and strategic insights based on financial analysis",
-    verbose=True,
-    memory=True,
+    verbose=VERBOSE,
+    memory=False,
     backstory=(
         "You are a certified investment advisor with CFA designation and over 12 years of experience "
         "in portfolio management and investment strategy. You have managed portfolios for high-net-worth "
@@ -78,15 +118,15 @@ investment_advisor = Agent(
         tools=[read_financial_document] if search_tool is None else [read_financial_document, search_tool],
     llm=llm if llm else None,
     max_iter=3,
-    max_rpm=10,
+    max_rpm=AGENT_MAX_RPM,
     allow_delegation=False
 )
 
 risk_assessor = Agent(
     role="Risk Management Analyst",
     goal="Conduct comprehensive risk assessment and provide risk mitigation strategies based on financial data",
-    verbose=True,
-    memory=True,
+    verbose=VERBOSE,
+    memory=False,
     backstory=(
         "You are a risk management professional with expertise in financial risk analysis, regulatory "
         "compliance, and quantitative risk modeling. You have worked in major banks and financial "
@@ -99,6 +139,6 @@ risk_assessor = Agent(
         tools=[read_financial_document] if search_tool is None else [read_financial_document, search_tool],
     llm=llm if llm else None,
     max_iter=3,
-    max_rpm=10,
+    max_rpm=AGENT_MAX_RPM,
     allow_delegation=False
 )
\ No newline at end of file
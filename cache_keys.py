@@ -0,0 +1,15 @@
+## Cache key helpers shared by the API, the worker and the tools
+# Standard library only, so tools.py can use them without importing the database layer
+import hashlib
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups (lowercased, whitespace collapsed)"""
+    return " ".join(query.lower().split())
+
+def hash_file(file_path: str) -> str:
+    """Hash a file's content for cache lookups, reading it in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -2,14 +2,20 @@
 Database package for Financial Document Analyzer
 """
 
-from .database import User, Analysis, get_db, init_database, close_database
+from .database import Base, SessionLocal, database, User, Analysis, AnalysisStatus, AnalysisType, get_db, init_database, migrate_database, close_database
 from .crud import UserCRUD, AnalysisCRUD
 
 __all__ = [
+    "Base",
+    "SessionLocal",
+    "database",
     "User",
     "Analysis", 
+    "AnalysisStatus",
+    "AnalysisType",
     "get_db",
     "init_database",
+    "migrate_database",
     "close_database",
     "UserCRUD",
     "AnalysisCRUD"
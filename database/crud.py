@@ -2,11 +2,56 @@
 CRUD operations for Financial Document Analyzer database
 """
 
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from .database import User, Analysis
+from sqlalchemy import bindparam, desc, func, select, update
+from sqlalchemy.engine import Row
+from .database import User, Analysis, AnalysisStatus
+
+# Completed analyses for the same file + query are reused for this long
+ANALYSIS_CACHE_TTL = timedelta(hours=24)
+
+# Short-lived cache for status polling (GET /analyses/{id}); an analysis row changes
+# only a few times per run, so a couple of seconds of staleness is acceptable
+_analysis_cache = TTLCache(maxsize=10_000, ttl=2.0)
+_analysis_cache_lock = threading.Lock()
+
+# Hot-path statements are built once; the per-call values are bound parameters,
+# so SQLAlchemy's compiled-statement cache is hit on every call
+# Listing only needs these columns; skipping the large result columns keeps rows small
+_RECENT_ANALYSES = (
+    select(
+        Analysis.id,
+        Analysis.query,
+        Analysis.status,
+        Analysis.analysis_type,
+        Analysis.created_at,
+        Analysis.completed_at,
+        Analysis.user_id
+    )
+    .order_by(desc(Analysis.created_at))
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+_ANALYSIS_VERSION = (
+    select(Analysis.status, Analysis.started_at, Analysis.created_at, Analysis.updated_at)
+    .where(Analysis.id == bindparam("analysis_id"))
+)
+_COUNT_ANALYSES = select(func.count()).select_from(Analysis)
+# The session is committed right after, which expires loaded objects anyway
+_UPDATE_ANALYSIS = (
+    update(Analysis)
+    .where(Analysis.id == bindparam("analysis_id"))
+    .execution_options(synchronize_session=False)
+)
+
+def invalidate_cached_analysis(analysis_id: int) -> None:
+    """Drop an analysis from the polling cache after it was written"""
+    with _analysis_cache_lock:
+        _analysis_cache.pop(analysis_id, None)
 
 # User CRUD operations
 class UserCRUD:
@@ -22,7 +67,7 @@ class UserCRUD:
     @staticmethod
     def get_user(db: Session, user_id: int) -> Optional[User]:
         """Get user by ID"""
-        return db.query(User).filter(User.id == user_id).first()
+        return db.get(User, user_id)
     
     @staticmethod
     def get_user_by_email(db: Session, email: str) -> Optional[User]:
@@ -43,7 +88,7 @@ class AnalysisCRUD:
             user_id=user_id,
             query=query,
             analysis_type=analysis_type,
-            status="pending"
+            status=AnalysisStatus.PENDING
         )
         db.add(analysis)
         db.commit()
@@ -52,15 +97,34 @@ class AnalysisCRUD:
     
     @staticmethod
     def get_analysis(db: Session, analysis_id: int) -> Optional[Analysis]:
-        """Get analysis by ID"""
-        return db.query(Analysis).filter(Analysis.id == analysis_id).first()
+        """Get analysis by ID (cached for a couple of seconds)"""
+        with _analysis_cache_lock:
+            analysis = _analysis_cache.get(analysis_id)
+        if analysis is not None:
+            return analysis
+        
+        analysis = db.get(Analysis, analysis_id)
+        if analysis is not None:
+            # Detach so a later commit on this session can't expire the cached copy
+            db.expunge(analysis)
+            with _analysis_cache_lock:
+                _analysis_cache[analysis_id] = analysis
+        return analysis
     
+    @staticmethod
+    def get_analysis_version(db: Session, analysis_id: int) -> Optional[Row]:
+        """Get the status and timestamps of an analysis without loading its results"""
+        return db.execute(_ANALYSIS_VERSION, {"analysis_id": analysis_id}).first()
     
+    @staticmethod
+    def get_recent_analyses(db: Session, skip: int = 0, limit: int = 100) -> List[Row]:
+        """Get recent analyses (listing columns only, without results)"""
+        return db.execute(_RECENT_ANALYSES, {"skip": skip, "limit": limit}).all()
     
     @staticmethod
-    def get_recent_analyses(db: Session, skip: int = 0, limit: int = 100) -> List[Analysis]:
-        """Get recent analyses"""
-        return db.query(Analysis).order_by(desc(Analysis.created_at)).offset(skip).limit(limit).all()
+    def count_analyses(db: Session) -> int:
+        """Count all analyses"""
+        return db.execute(_COUNT_ANALYSES).scalar_one()
     
     @staticmethod
     def update_analysis_status(
@@ -69,27 +133,42 @@ class AnalysisCRUD:
         status: str, 
         result_summary: str = None,
         detailed_results: Dict[str, Any] = None,
-        error_message: str = None
+        error_message: str = None,
+        fetch: bool = False
     ) -> Optional[Analysis]:
-        """Update analysis status and results"""
-        analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-        if analysis:
-            analysis.status = status
-            
-            if status == "processing":
-                analysis.started_at = datetime.utcnow()
-            elif status in ["completed", "failed"]:
-                analysis.completed_at = datetime.utcnow()
-            
-            if result_summary:
-                analysis.result_summary = result_summary
-            if detailed_results:
-                analysis.detailed_results = detailed_results
-            if error_message:
-                analysis.error_message = error_message
-            
+        """Update analysis status and results with a single UPDATE statement.
+
+        The updated row is only loaded when ``fetch`` is True; otherwise None is returned.
+        """
+        status = AnalysisStatus.coerce(status)
+        now = datetime.utcnow()
+        values = {"status": status, "updated_at": now}
+        
+        if status == AnalysisStatus.PROCESSING:
+            values["started_at"] = now
+        elif status in (AnalysisStatus.COMPLETED, AnalysisStatus.FAILED):
+            values["completed_at"] = now
+        
+        if result_summary:
+            values["result_summary"] = result_summary
+        if detailed_results:
+            values["detailed_results"] = detailed_results
+        if error_message:
+            values["error_message"] = error_message
+        
+        stmt = _UPDATE_ANALYSIS.values(**values)
+        params = {"analysis_id": analysis_id}
+        
+        if fetch and db.get_bind().dialect.update_returning:
+            # Postgres / SQLite 3.35+: get the updated row back in the same round-trip
+            analysis = db.execute(stmt.returning(Analysis), params).scalar_one_or_none()
             db.commit()
-            db.refresh(analysis)
-        return analysis
+            invalidate_cached_analysis(analysis_id)
+            return analysis
+        
+        db.execute(stmt, params)
+        db.commit()
+        invalidate_cached_analysis(analysis_id)
+        return db.get(Analysis, analysis_id) if fetch else None
     
 
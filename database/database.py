@@ -3,29 +3,143 @@ Database configuration and models for Financial Document Analyzer
 """
 
 import os
+import sqlite3
+import orjson
 from datetime import datetime
+from enum import IntEnum
 from typing import Optional, List
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, SmallInteger, String, Text, DateTime, Boolean, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.types import TypeDecorator
 from databases import Database
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./financial_analyzer.db")
 
+def _set_sqlite_pragmas(dbapi_connection):
+    """Use WAL so API reads don't block on worker commits, and skip fsync per commit"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+class PragmaConnection(sqlite3.Connection):
+    """sqlite3 connection set up like the engine's, for the databases (aiosqlite) pool.
+
+    databases opens a new connection per acquire and never fires engine events.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _set_sqlite_pragmas(self)
+
 # For development, use SQLite. For production, use PostgreSQL
 if DATABASE_URL.startswith("sqlite"):
     # SQLite configuration
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _set_sqlite_pragmas(dbapi_connection)
+    
+    # Passed through aiosqlite to sqlite3.connect
+    DATABASE_OPTIONS = {"factory": PragmaConnection}
 else:
     # PostgreSQL configuration
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+    DATABASE_OPTIONS = {}
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Async database connection
-database = Database(DATABASE_URL)
+database = Database(DATABASE_URL, **DATABASE_OPTIONS)
+
+# Enumerated columns, stored as small integers
+class LabeledIntEnum(IntEnum):
+    """IntEnum that also accepts and renders its lowercase name ("pending", ...)"""
+    
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+    
+    @classmethod
+    def coerce(cls, value):
+        """Convert a member, an integer (or digit string) or a name to a member"""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str) and not value.isdigit():
+            return cls[value.upper()]
+        return cls(int(value))
+
+class AnalysisStatus(LabeledIntEnum):
+    PENDING = 0
+    PROCESSING = 1
+    COMPLETED = 2
+    FAILED = 3
+
+class AnalysisType(LabeledIntEnum):
+    COMPREHENSIVE = 0
+    INVESTMENT = 1
+    RISK = 2
+    VERIFICATION = 3
+
+class IntEnumType(TypeDecorator):
+    """SMALLINT column that accepts enum members or their names and returns members"""
+    impl = SmallInteger
+    cache_ok = True
+    
+    def __init__(self, enum_class, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.enum_class = enum_class
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(self.enum_class.coerce(value))
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.enum_class.coerce(value)
+
+class OrjsonJSON(TypeDecorator):
+    """JSON column (JSONB on PostgreSQL) encoded and decoded with orjson.
+
+    The column type does the encoding rather than the dialect's JSON settings, so it
+    also applies to queries run through databases, which compiles with its own dialect.
+    """
+    impl = JSON
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(JSON())
+    
+    def bind_processor(self, dialect):
+        def process(value):
+            # orjson handles datetime/UUID natively
+            return None if value is None else orjson.dumps(value).decode()
+        return process
+    
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            # psycopg2 hands JSON back already decoded
+            return orjson.loads(value) if isinstance(value, (str, bytes)) else value
+        return process
 
 # Database Models
 class User(Base):
@@ -45,26 +159,35 @@ class Analysis(Base):
     __tablename__ = "analyses"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     
     # Analysis metadata
     query = Column(Text, nullable=False)
-    status = Column(String, default="pending")  # pending, processing, completed, failed
-    analysis_type = Column(String, default="comprehensive")  # comprehensive, investment, risk, verification
+    status = Column(IntEnumType(AnalysisStatus), default=AnalysisStatus.PENDING, index=True)
+    analysis_type = Column(IntEnumType(AnalysisType), default=AnalysisType.COMPREHENSIVE)
+    
+    # Result cache key: uploaded file content hash + normalized query
+    file_sha256 = Column(String(64), nullable=True, index=True)
+    query_normalized = Column(Text, nullable=True)
     
     # Results
     result_summary = Column(Text, nullable=True)
-    detailed_results = Column(JSON, nullable=True)
+    detailed_results = Column(OrjsonJSON, nullable=True)
     error_message = Column(Text, nullable=True)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
+    # Bumped on every write; backs the ETag of GET /analyses/{id}
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="analyses")
 
+# Recent analyses per user: WHERE user_id = ? ORDER BY created_at DESC
+Index("ix_analyses_user_created", Analysis.user_id, Analysis.created_at.desc())
+
 
 # Database dependency
 def get_db():
@@ -77,9 +200,71 @@ def get_db():
 
 # Database initialization
 async def init_database():
-    """Initialize database tables"""
+    """Open the async database connection"""
     await database.connect()
+
+def migrate_database():
+    """Create missing tables and bring existing ones up to date.
+
+    Runs once before the web workers start (python main.py, or python -m database.init_db
+    when uvicorn is launched directly); concurrent runs would race on the DDL.
+    """
     Base.metadata.create_all(bind=engine)
+    upgrade_existing_tables()
+
+def upgrade_existing_tables():
+    """Add nullable columns and indexes introduced after a table was first created.
+
+    create_all skips tables that already exist, so dev databases would otherwise
+    miss newer columns and indexes.
+    """
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(
+                            f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"
+                        ))
+                except DBAPIError:
+                    # Another process added it first ("duplicate column"); anything else is re-raised
+                    if column.name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+                        raise
+    
+    migrate_enum_columns()
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def migrate_enum_columns():
+    """Convert enum columns still stored as their string names to small integers"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if not isinstance(column.type, IntEnumType) or not isinstance(existing.get(column.name), String):
+                    continue
+                
+                name = engine.dialect.identifier_preparer.quote(column.name)
+                whens = " ".join(
+                    f"WHEN '{member.label}' THEN {member.value}" for member in column.type.enum_class
+                )
+                if engine.dialect.name == "postgresql":
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ALTER COLUMN {name} TYPE SMALLINT USING CASE {name} {whens} END"
+                    ))
+                else:
+                    # SQLite keeps the declared column type; the integers are what matter
+                    labels = ", ".join(f"'{member.label}'" for member in column.type.enum_class)
+                    conn.execute(text(
+                        f"UPDATE {table.name} SET {name} = CASE {name} {whens} END WHERE {name} IN ({labels})"
+                    ))
 
 async def close_database():
     """Close database connection"""
@@ -2,19 +2,14 @@
 Database initialization script for Financial Document Analyzer
 """
 
-import asyncio
-from .database import init_database, close_database, Base, engine
+from .database import migrate_database
 
-async def create_tables():
-    """Create all database tables"""
+def create_tables():
+    """Create all database tables and add columns introduced since they were created"""
     print("🔄 Initializing database...")
     
     try:
-        # Initialize database connection
-        await init_database()
-        
-        # Create all tables
-        Base.metadata.create_all(bind=engine)
+        migrate_database()
         
         print("✅ Database tables created successfully!")
         print("📊 Tables created:")
@@ -24,9 +19,6 @@ async def create_tables():
     except Exception as e:
         print(f"❌ Error creating database tables: {e}")
         raise
-    finally:
-        # Close database connection
-        await close_database()
 
 if __name__ == "__main__":
-    asyncio.run(create_tables())
+    create_tables()
@@ -1,24 +1,66 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request, Response, BackgroundTasks
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 import os
-import uuid
+import secrets
 import asyncio
-from datetime import datetime
+import hashlib
+import aiofiles
+import orjson
+from pathlib import Path
+from typing import Any, Dict, Optional
 
-from crewai import Crew, Process
-from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from task import analyze_financial_document as analyze_task, verification, investment_analysis, risk_assessment
-from database.database import get_db, init_database, close_database
-from database.crud import AnalysisCRUD
-from redis_queue.queue_config import get_queue, is_redis_available
+from cache_keys import normalize_query
+from database import get_db, init_database, migrate_database, close_database, AnalysisCRUD, AnalysisStatus
+from redis_queue.queue_config import get_queue, is_redis_available, get_analysis_progress, get_cached_result, get_queue_counts
 from redis_queue.background_tasks import run_financial_analysis
 
-app = FastAPI(title="Financial Document Analyzer", description="AI-powered financial document analysis system")
+app = FastAPI(
+    title="Financial Document Analyzer",
+    description="AI-powered financial document analysis system",
+    default_response_class=ORJSONResponse
+)
+
+DISCLAIMER = "This analysis is for informational purposes only. Please consult with qualified financial professionals before making investment decisions."
+
+# Response models
+class FileInfo(BaseModel):
+    filename: str
+    file_size: int
+
+class AnalysisInfo(BaseModel):
+    analysis_id: int
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+    summary: Optional[str] = None
+    detailed_results: Optional[Dict[str, Any]] = None
+
+class AnalyzeResponse(BaseModel):
+    status: str
+    message: str
+    query: str
+    analysis: AnalysisInfo
+    file_info: FileInfo
+    disclaimer: str = DISCLAIMER
+
+# Accepted upload file extensions (lowercase)
+ALLOWED_EXTENSIONS = frozenset({".pdf"})
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Staging directory for uploads, shared with the queue workers. Uploads only live until
+# the worker has read them, so a tmpfs such as /dev/shm/financial-analyzer can be used
+# when it has room for the concurrent uploads (Docker's default /dev/shm is 64MB)
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "data"))
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Database initialization
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Connect to the database on startup and refuse to serve without the Redis queue"""
+    get_queue().connection.ping()
     await init_database()
 
 @app.on_event("shutdown")
@@ -26,49 +68,46 @@ async def shutdown_event():
     """Close database on shutdown"""
     await close_database()
 
-def run_crew(query: str, file_path: str = "data/sample.pdf"):
-    """Run the complete financial analysis crew"""
-    try:
-        financial_crew = Crew(
-            agents=[financial_analyst, verifier, investment_advisor, risk_assessor],
-            tasks=[verification, analyze_task, investment_analysis, risk_assessment],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        result = financial_crew.kickoff({'query': query})
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Crew execution failed: {str(e)}")
+# The status endpoints are static and polled by load balancers, so they are serialized once
+_ROOT_RESPONSE = orjson.dumps({
+    "message": "Financial Document Analyzer API is running",
+    "status": "healthy",
+    "endpoints": {
+        "analyze": "/analyze - POST - Upload financial document for analysis",
+        "health": "/ - GET - Health check"
+    }
+})
+_HEALTH_RESPONSE = orjson.dumps({
+    "status": "healthy",
+    "service": "Financial Document Analyzer",
+    "version": "1.0.0",
+    "components": {
+        "agents": ["financial_analyst", "verifier", "investment_advisor", "risk_assessor"],
+        "tools": ["document_reader", "web_search"],
+        "supported_formats": ["PDF"]
+    }
+})
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "message": "Financial Document Analyzer API is running",
-        "status": "healthy",
-        "endpoints": {
-            "analyze": "/analyze - POST - Upload financial document for analysis",
-            "health": "/ - GET - Health check"
-        }
-    }
+    return Response(_ROOT_RESPONSE, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
     """Detailed health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "Financial Document Analyzer",
-        "version": "1.0.0",
-        "components": {
-            "agents": ["financial_analyst", "verifier", "investment_advisor", "risk_assessor"],
-            "tools": ["document_reader", "web_search"],
-            "supported_formats": ["PDF"]
-        }
-    }
+    return Response(_HEALTH_RESPONSE, media_type="application/json")
 
-@app.post("/analyze")
+def _remove_upload(file_path: str):
+    """Remove an upload that will not be handed to a worker"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+@app.post("/analyze", response_model=AnalyzeResponse, response_model_exclude_none=True)
 async def analyze_financial_document_endpoint(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     query: str = Form(default="Provide a comprehensive analysis of this financial document including key metrics, trends, investment outlook, and risk assessment"),
     db: Session = Depends(get_db)
@@ -85,22 +124,28 @@ async def analyze_financial_document_endpoint(
     """
     
     # Validate file type
-    if not file.filename.lower().endswith('.pdf'):
+    if os.path.splitext(file.filename or "")[1].lower() not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
-    file_id = str(uuid.uuid4())
-    file_path = f"data/financial_document_{file_id}.pdf"
+    file_id = secrets.token_hex(16)
+    file_path = str(UPLOAD_DIR / f"financial_document_{file_id}.pdf")
+    job = cached = None
     
     try:
-        # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
+        # Save uploaded file, streaming it to disk in chunks instead of buffering it whole
+        file_size = 0
+        file_digest = hashlib.sha256()
+        async with aiofiles.open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
+                file_digest.update(chunk)
+                file_size += len(chunk)
+        # Only the size is needed from here on; release the spooled upload buffer now
+        # rather than when the request finishes
+        await file.close()
         
-        # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            if len(content) == 0:
-                raise HTTPException(status_code=400, detail="Uploaded file is empty")
-            f.write(content)
+        if file_size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
         
         # Validate and sanitize query
         if not query or query.strip() == "":
@@ -108,83 +153,54 @@ async def analyze_financial_document_endpoint(
         
         query = query.strip()[:1000]  # Limit query length for security
         
+        # The sync DB and Redis calls below run in worker threads so they don't stall the event loop
+        # Same document and query analyzed recently: answer from the result cache, no job needed
+        cached = await asyncio.to_thread(get_cached_result, file_digest.hexdigest(), normalize_query(query))
+        if cached is not None:
+            background_tasks.add_task(_remove_upload, file_path)
+            return AnalyzeResponse(
+                status="success",
+                message="Financial document analyzed successfully (cached result)",
+                query=query,
+                analysis=AnalysisInfo(
+                    analysis_id=cached["analysis_id"],
+                    summary=cached["result_summary"],
+                    detailed_results=cached["detailed_results"]
+                ),
+                file_info=FileInfo(filename=file.filename, file_size=file_size)
+            )
+        
         # Create analysis record
-        analysis_record = AnalysisCRUD.create_analysis(
+        analysis_record = await asyncio.to_thread(
+            AnalysisCRUD.create_analysis,
             db=db,
             query=query,
             analysis_type="comprehensive"
         )
         
-        # Check if Redis queue is available
-        if is_redis_available():
-            # Queue the analysis task
-            queue = get_queue()
-            job = queue.enqueue(
-                run_financial_analysis,
-                analysis_record.id,
-                query,
-                file_path,
-                timeout='10m'  # 10 minute timeout
-            )
-            
-            return {
-                "status": "queued",
-                "message": "Financial document analysis queued for processing",
-                "query": query,
-                "analysis": {
-                    "analysis_id": analysis_record.id,
-                    "job_id": job.id,
-                    "status": "queued",
-                    "summary": "Analysis has been queued and will be processed in the background"
-                },
-                "file_info": {
-                    "filename": file.filename,
-                    "file_size": len(content)
-                },
-                "disclaimer": "This analysis is for informational purposes only. Please consult with qualified financial professionals before making investment decisions."
-            }
-        else:
-            # Fallback to synchronous processing if Redis is not available
-            analysis_result = run_crew(query=query, file_path=file_path)
-            
-            # Update analysis with results
-            AnalysisCRUD.update_analysis_status(
-                db=db,
+        # Queue the analysis task; there is no inline fallback, the API only enqueues
+        queue = get_queue()
+        job = await asyncio.to_thread(
+            queue.enqueue,
+            run_financial_analysis,
+            analysis_record.id,
+            query,
+            file_path,
+            job_timeout='10m'  # 10 minute timeout
+        )
+        
+        return AnalyzeResponse(
+            status="queued",
+            message="Financial document analysis queued for processing",
+            query=query,
+            analysis=AnalysisInfo(
                 analysis_id=analysis_record.id,
-                status="completed",
-                result_summary="Comprehensive financial analysis completed by AI specialists",
-                detailed_results={
-                    "analysis_result": str(analysis_result),
-                    "components_analyzed": [
-                        "Document verification and authenticity",
-                        "Financial performance metrics and trends",
-                        "Investment opportunities and recommendations",
-                        "Risk assessment and mitigation strategies"
-                    ]
-                }
-            )
-            
-            return {
-                "status": "success",
-                "message": "Financial document analyzed successfully",
-                "query": query,
-                "analysis": {
-                    "analysis_id": analysis_record.id,
-                    "summary": "Comprehensive financial analysis completed by AI specialists",
-                    "detailed_results": str(analysis_result),
-                    "components_analyzed": [
-                        "Document verification and authenticity",
-                        "Financial performance metrics and trends",
-                        "Investment opportunities and recommendations", 
-                        "Risk assessment and mitigation strategies"
-                    ]
-                },
-                "file_info": {
-                    "filename": file.filename,
-                    "file_size": len(content)
-                },
-                "disclaimer": "This analysis is for informational purposes only. Please consult with qualified financial professionals before making investment decisions."
-            }
+                job_id=job.id,
+                status="queued",
+                summary="Analysis has been queued and will be processed in the background"
+            ),
+            file_info=FileInfo(filename=file.filename, file_size=file_size)
+        )
         
     except HTTPException:
         raise
@@ -192,7 +208,8 @@ async def analyze_financial_document_endpoint(
         # Update analysis status to failed if we have an analysis record
         if 'analysis_record' in locals():
             try:
-                AnalysisCRUD.update_analysis_status(
+                await asyncio.to_thread(
+                    AnalysisCRUD.update_analysis_status,
                     db=db,
                     analysis_id=analysis_record.id,
                     status="failed",
@@ -203,8 +220,10 @@ async def analyze_financial_document_endpoint(
         raise HTTPException(status_code=500, detail=f"Error processing financial document: {str(e)}")
     
     finally:
-        # File cleanup is now handled in the background task
-        pass
+        # Once queued, the worker removes the upload after analyzing it. Error responses
+        # don't run background tasks, so anything left behind is removed here
+        if job is None and not cached:
+            await asyncio.to_thread(_remove_upload, file_path)
 
 # New database-related endpoints
 @app.get("/analyses")
@@ -214,14 +233,21 @@ async def get_analyses(
     db: Session = Depends(get_db)
 ):
     """Get recent analyses with pagination"""
-    analyses = AnalysisCRUD.get_recent_analyses(db=db, skip=skip, limit=limit)
+    # Both queries share the request's session, which is not thread-safe, so they run
+    # back to back in one worker thread
+    total, analyses = await asyncio.to_thread(
+        lambda: (
+            AnalysisCRUD.count_analyses(db=db),
+            AnalysisCRUD.get_recent_analyses(db=db, skip=skip, limit=limit)
+        )
+    )
     return {
         "analyses": [
             {
                 "id": analysis.id,
                 "query": analysis.query,
-                "status": analysis.status,
-                "analysis_type": analysis.analysis_type,
+                "status": analysis.status.label,
+                "analysis_type": analysis.analysis_type.label,
                 "created_at": analysis.created_at,
                 "completed_at": analysis.completed_at,
                 "user_id": analysis.user_id
@@ -231,61 +257,126 @@ async def get_analyses(
         "pagination": {
             "skip": skip,
             "limit": limit,
-            "total": len(analyses)
+            "total": total
         }
     }
 
+def _current_status(analysis_id: int, analysis):
+    """Get the (status, started_at) of an analysis, including in-flight progress.
+
+    In-flight progress is only recorded in Redis until the worker persists the result.
+    """
+    progress = get_analysis_progress(analysis_id) if analysis.status == AnalysisStatus.PENDING else None
+    return progress or (analysis.status.label, analysis.started_at)
+
+def _analysis_etag(analysis, status: str) -> str:
+    changed_at = analysis.updated_at or analysis.created_at
+    return f'W/"{changed_at.timestamp()}-{status}"'
+
+async def _check_analysis_version(analysis_id: int, request: Request, db: Session):
+    """Get (status, started_at, etag) of an analysis without loading its results.
+
+    Raises 404 if it doesn't exist; the ETag is None when the client's copy is current.
+    """
+    version = await asyncio.to_thread(AnalysisCRUD.get_analysis_version, db=db, analysis_id=analysis_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    status, started_at = await asyncio.to_thread(_current_status, analysis_id, version)
+    etag = _analysis_etag(version, status)
+    if request.headers.get("if-none-match") == etag:
+        return status, started_at, None
+    return status, started_at, etag
+
 @app.get("/analyses/{analysis_id}")
 async def get_analysis(
     analysis_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Get specific analysis by ID"""
-    analysis = AnalysisCRUD.get_analysis(db=db, analysis_id=analysis_id)
+    """Get specific analysis by ID; answers 304 Not Modified while the client's ETag is current"""
+    _, _, etag = await _check_analysis_version(analysis_id, request, db)
+    if etag is None:
+        return Response(status_code=304, headers={"ETag": request.headers["if-none-match"]})
+    
+    analysis = await asyncio.to_thread(AnalysisCRUD.get_analysis, db=db, analysis_id=analysis_id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
+    # The row may come from the short-lived cache, so the body's ETag is derived from it
+    status, started_at = await asyncio.to_thread(_current_status, analysis_id, analysis)
+    response.headers["ETag"] = _analysis_etag(analysis, status)
+    response.headers["Cache-Control"] = "no-cache"
+    
     return {
         "id": analysis.id,
         "query": analysis.query,
-        "status": analysis.status,
-        "analysis_type": analysis.analysis_type,
+        "status": status,
+        "analysis_type": analysis.analysis_type.label,
         "result_summary": analysis.result_summary,
         "detailed_results": analysis.detailed_results,
         "error_message": analysis.error_message,
         "created_at": analysis.created_at,
-        "started_at": analysis.started_at,
+        "started_at": started_at,
         "completed_at": analysis.completed_at,
+        "updated_at": analysis.updated_at,
         "user_id": analysis.user_id
     }
 
+@app.get("/analyses/{analysis_id}/status")
+async def get_analysis_status(
+    analysis_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Get only the status of an analysis, for clients polling until it finishes"""
+    status, started_at, etag = await _check_analysis_version(analysis_id, request, db)
+    if etag is None:
+        return Response(status_code=304, headers={"ETag": request.headers["if-none-match"]})
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return {
+        "id": analysis_id,
+        "status": status,
+        "started_at": started_at
+    }
+
 @app.get("/queue/status")
 async def get_queue_status():
     """Get queue status and statistics"""
     if not is_redis_available():
         return {
             "status": "unavailable",
-            "message": "Redis queue is not available",
-            "fallback": "Using synchronous processing"
+            "message": "Redis queue is not available"
         }
     
-    queue = get_queue()
+    pending, failed, finished = await asyncio.to_thread(get_queue_counts)
     
     return {
         "status": "available",
         "queue_name": "analysis",
-        "pending_jobs": len(queue),
-        "failed_jobs": len(queue.failed_job_registry),
-        "finished_jobs": len(queue.finished_job_registry),
+        "pending_jobs": pending,
+        "failed_jobs": failed,
+        "finished_jobs": finished,
         "message": "Redis queue is operational"
     }
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
+    # reload forks a file watcher and only supports a single worker, so it is opt-in for development
+    reload = os.getenv("UVICORN_RELOAD", "0") == "1"
+    # Schema changes run here, once, rather than in the startup hook of every web worker
+    migrate_database()
     uvicorn.run(
-        app, 
+        "main:app", 
         host="0.0.0.0", 
         port=8000, 
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+        workers=1 if reload else int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        reload=reload,
+        log_level=os.getenv("LOG_LEVEL", "warning")
+    )
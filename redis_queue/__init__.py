@@ -3,12 +3,8 @@ Redis Queue package for Financial Document Analyzer
 """
 
 from .queue_config import get_queue, is_redis_available
-from .background_tasks import run_financial_analysis
-from .worker import start_worker
 
 __all__ = [
     "get_queue",
-    "is_redis_available", 
-    "run_financial_analysis",
-    "start_worker"
+    "is_redis_available"
 ]
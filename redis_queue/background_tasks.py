@@ -3,50 +3,210 @@ Background tasks for Financial Document Analyzer using Redis Queue
 """
 
 import os
-from crewai import Crew, Process
-from agents import financial_analyst, verifier, investment_advisor, risk_assessor
-from task import analyze_financial_document as analyze_task, verification, investment_analysis, risk_assessment
-from database.database import SessionLocal
-from database.crud import AnalysisCRUD
+import atexit
+import asyncio
+import functools
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import select, update
+from cache_keys import normalize_query, hash_file
+from database import database, Analysis, AnalysisStatus
+from database.crud import ANALYSIS_CACHE_TTL, invalidate_cached_analysis
+from .queue_config import set_analysis_progress, clear_analysis_progress, cache_result
 
-def run_financial_analysis(analysis_id: int, query: str, file_path: str):
+# CrewAI verbose console output is opt-in (CREW_VERBOSE=1)
+VERBOSE = os.getenv("CREW_VERBOSE", "0") == "1"
+
+# Job logs go through a queue; a listener thread does the (blocking) stream writes
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+
+@functools.lru_cache(maxsize=None)
+def _start_log_listener(pid: int):
+    """Start the log listener once per process (threads don't survive RQ's fork)"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(_log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def _flush_logs():
+    """Write out every queued log record before the job returns.
+
+    RQ's work horse leaves through os._exit once the job is done, so atexit never
+    runs there; stopping the listener drains the queue, and it is started again
+    for any job (or API background task) that keeps logging in this process.
+    """
+    listener = _start_log_listener(os.getpid())
+    listener.stop()
+    listener.start()
+
+# Crew/Task objects keep per-run state (task outputs, usage metrics), so a pipeline
+# run is not reentrant; serialize runs that share the crews within a process.
+_PIPELINE_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=1)
+def _get_crews():
+    """Build the financial analysis crews once per process, on first use.
+
+    Verification gates the financial analysis, which runs as one sequential crew.
+    The investment and risk tasks both only consume the analysis output (via task
+    context), so each gets a single-task crew and the two run concurrently. They
+    can't share one crew with async_execution=True: a crew may end with at most one
+    async task, and a sync task waits for every pending async task before it starts.
+
+    crewai and the agent/LLM modules are imported here rather than at module load,
+    so processes that only enqueue jobs (the API) never pay for them.
+    """
+    from crewai import Crew, Process
+    from agents import financial_analyst, verifier, investment_advisor, risk_assessor
+    from task import analyze_financial_document as analyze_task, verification, investment_analysis, risk_assessment
+    
+    analysis_crew = Crew(
+        agents=[verifier, financial_analyst],
+        tasks=[verification, analyze_task],
+        process=Process.sequential,
+        verbose=VERBOSE
+    )
+    investment_crew = Crew(
+        agents=[investment_advisor],
+        tasks=[investment_analysis],
+        process=Process.sequential,
+        verbose=VERBOSE
+    )
+    risk_crew = Crew(
+        agents=[risk_assessor],
+        tasks=[risk_assessment],
+        process=Process.sequential,
+        verbose=VERBOSE
+    )
+    return analysis_crew, investment_crew, risk_crew
+
+def warm_up():
+    """Build the crews now; processes forked afterwards (RQ work horses) inherit them warm"""
+    _get_crews()
+
+async def run_analysis_pipeline(query: str, file_path: str):
+    """Run verification + analysis, then investment and risk assessment in parallel.
+
+    Returns the CrewOutput of each stage: (analysis, investment, risk)
+    """
+    analysis_crew, investment_crew, risk_crew = _get_crews()
+    inputs = {'query': query, 'file_path': file_path}
+    
+    await asyncio.to_thread(_PIPELINE_LOCK.acquire)
+    try:
+        analysis_output = await analysis_crew.kickoff_async(inputs=inputs)
+        investment_output, risk_output = await asyncio.gather(
+            investment_crew.kickoff_async(inputs=inputs),
+            risk_crew.kickoff_async(inputs=inputs)
+        )
+    finally:
+        _PIPELINE_LOCK.release()
+    
+    return analysis_output, investment_output, risk_output
+
+def _crew_output_results(*crew_outputs) -> dict:
+    """Merge the structured fields of the stage CrewOutputs for the detailed_results column"""
+    token_usage = {}
+    for crew_output in crew_outputs:
+        usage = getattr(crew_output, "token_usage", None)
+        for key, value in (usage.model_dump() if usage is not None else {}).items():
+            token_usage[key] = token_usage.get(key, 0) + value
+    
+    return {
+        # The investment and risk reports are the final deliverables
+        "raw": "\n\n".join(crew_output.raw for crew_output in crew_outputs[1:]),
+        "tasks": [
+            {"agent": task_output.agent, "output": task_output.raw}
+            for crew_output in crew_outputs
+            for task_output in crew_output.tasks_output
+        ],
+        "token_usage": token_usage or None
+    }
+
+async def _find_cached_result(file_sha256: str, query_norm: str):
+    """Look up a recent completed analysis of the same file and query.
+
+    Core select through the async connection: only the reused columns are fetched
+    and no ORM objects are built for a row that is only copied.
+    """
+    return await database.fetch_one(
+        select(Analysis.id, Analysis.result_summary, Analysis.detailed_results)
+        .where(
+            Analysis.file_sha256 == file_sha256,
+            Analysis.query_normalized == query_norm,
+            Analysis.status == AnalysisStatus.COMPLETED,
+            Analysis.completed_at >= datetime.utcnow() - ANALYSIS_CACHE_TTL
+        )
+        .order_by(Analysis.completed_at.desc())
+        .limit(1)
+    )
+
+async def _update_analysis(analysis_id: int, **values):
+    """Write analysis fields in a short transaction of their own.
+
+    The connection goes back to the pool as soon as the write commits, so nothing
+    holds a database lock while the crew is running.
+    """
+    async with database.transaction():
+        await database.execute(
+            # Set explicitly rather than relying on the ORM-side onupdate default
+            update(Analysis).where(Analysis.id == analysis_id).values(updated_at=datetime.utcnow(), **values)
+        )
+    invalidate_cached_analysis(analysis_id)
+
+async def run_financial_analysis(analysis_id: int, query: str, file_path: str):
     """
     Background task to run financial analysis
     
+    The crew runs in a thread so the event loop stays free while the LLM calls
+    are in flight; RQ awaits the coroutine in its own event loop.
+    
     Args:
         analysis_id (int): ID of the analysis record in database
         query (str): Analysis query
         file_path (str): Path to the uploaded file
     """
-    db = SessionLocal()
+    _start_log_listener(os.getpid())
+    
+    # The API process connects on startup; workers connect per job
+    owns_connection = not database.is_connected
+    if owns_connection:
+        await database.connect()
+    
+    started_at = datetime.utcnow()
+    file_sha256 = None
+    query_norm = normalize_query(query)
     
     try:
-        # Update status to processing
-        AnalysisCRUD.update_analysis_status(
-            db=db,
-            analysis_id=analysis_id,
-            status="processing"
-        )
-        
-        # Run the financial analysis crew
-        financial_crew = Crew(
-            agents=[financial_analyst, verifier, investment_advisor, risk_assessor],
-            tasks=[verification, analyze_task, investment_analysis, risk_assessment],
-            process=Process.sequential,
-            verbose=True
-        )
+        # "processing" is only tracked in Redis; the database is written once the run ends
+        try:
+            set_analysis_progress(analysis_id, "processing", started_at)
+        except Exception as redis_error:
+            logger.warning("Could not record progress for analysis %s: %s", analysis_id, redis_error)
         
-        # Execute analysis
-        analysis_result = financial_crew.kickoff({'query': query})
+        file_sha256 = await asyncio.to_thread(hash_file, file_path)
         
-        # Update analysis with results
-        AnalysisCRUD.update_analysis_status(
-            db=db,
-            analysis_id=analysis_id,
-            status="completed",
-            result_summary="Comprehensive financial analysis completed by AI specialists",
-            detailed_results={
-                "analysis_result": str(analysis_result),
+        # Same document and query analyzed recently: reuse the result instead of rerunning the crew
+        cached = await _find_cached_result(file_sha256, query_norm)
+        if cached is not None:
+            result_summary = cached["result_summary"]
+            detailed_results = cached["detailed_results"]
+            logger.info("Analysis %s served from cached analysis %s", analysis_id, cached["id"])
+        else:
+            # Execute analysis
+            crew_outputs = await run_analysis_pipeline(query, file_path)
+            result_summary = "Comprehensive financial analysis completed by AI specialists"
+            detailed_results = {
+                **_crew_output_results(*crew_outputs),
                 "components_analyzed": [
                     "Document verification and authenticity",
                     "Financial performance metrics and trends",
@@ -54,28 +214,60 @@ def run_financial_analysis(analysis_id: int, query: str, file_path: str):
                     "Risk assessment and mitigation strategies"
                 ]
             }
+        
+        # Update analysis with results
+        await _update_analysis(
+            analysis_id,
+            status="completed",
+            started_at=started_at,
+            completed_at=datetime.utcnow(),
+            file_sha256=file_sha256,
+            query_normalized=query_norm,
+            result_summary=result_summary,
+            detailed_results=detailed_results
         )
         
-        print(f"✅ Analysis {analysis_id} completed successfully")
+        # Let the API answer repeat uploads of this document + query straight from Redis
+        try:
+            cache_result(file_sha256, query_norm, {
+                "analysis_id": analysis_id,
+                "result_summary": result_summary,
+                "detailed_results": detailed_results
+            })
+        except Exception as redis_error:
+            logger.warning("Could not cache result of analysis %s: %s", analysis_id, redis_error)
+        
+        logger.info("Analysis %s completed successfully", analysis_id)
         
     except Exception as e:
         # Update analysis status to failed
-        AnalysisCRUD.update_analysis_status(
-            db=db,
-            analysis_id=analysis_id,
+        await _update_analysis(
+            analysis_id,
             status="failed",
+            started_at=started_at,
+            completed_at=datetime.utcnow(),
+            file_sha256=file_sha256,
+            query_normalized=query_norm,
             error_message=str(e)
         )
-        print(f"❌ Analysis {analysis_id} failed: {str(e)}")
+        logger.error("Analysis %s failed: %s", analysis_id, e)
         raise
         
     finally:
-        db.close()
+        try:
+            clear_analysis_progress(analysis_id)
+        except Exception as redis_error:
+            logger.warning("Could not clear progress for analysis %s: %s", analysis_id, redis_error)
+        
+        if owns_connection:
+            await database.disconnect()
         
         # Clean up uploaded file
         if os.path.exists(file_path):
             try:
-                os.remove(file_path)
-                print(f"🗑️ Cleaned up file: {file_path}")
+                await asyncio.to_thread(os.remove, file_path)
+                logger.info("Cleaned up file: %s", file_path)
             except Exception as cleanup_error:
-                print(f"⚠️ Could not clean up file {file_path}: {cleanup_error}")
+                logger.warning("Could not clean up file %s: %s", file_path, cleanup_error)
+        
+        _flush_logs()
@@ -3,33 +3,163 @@ Simple Redis Queue Configuration for Financial Document Analyzer
 """
 
 import os
+import time
+import hashlib
+import functools
+from datetime import datetime
+import orjson
 import redis
+from cachetools.func import ttl_cache
 from rq import Queue
 
 # Redis connection configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
-# Create Redis connection
-try:
-    redis_conn = redis.from_url(REDIS_URL)
-    # Test connection
-    redis_conn.ping()
-    print("✅ Redis connection successful")
-except Exception as e:
-    print(f"⚠️ Redis connection failed: {e}")
-    print("⚠️ Using in-memory fallback (not recommended for production)")
-    redis_conn = None
-
-# Create RQ queue
-if redis_conn:
-    analysis_queue = Queue('analysis', connection=redis_conn)
-else:
-    analysis_queue = None
+# Liveness probes are cached this long so hot paths don't ping Redis on every call
+REDIS_PROBE_TTL_SECONDS = 5
 
-def get_queue():
-    """Get the analysis queue"""
-    return analysis_queue
+@functools.lru_cache(maxsize=1)
+def get_redis_connection():
+    """Get the shared Redis client; nothing connects until the first command"""
+    # One pooled client per process; keepalive and health checks keep idle pooled
+    # sockets usable so enqueues and status reads don't pay for reconnects
+    return redis.from_url(
+        REDIS_URL,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "64")),
+        socket_keepalive=True,
+        health_check_interval=30
+    )
+
+_last_probe = (float("-inf"), False)
 
 def is_redis_available():
-    """Check if Redis is available"""
-    return redis_conn is not None
+    """Check if Redis is available, probing at most once per REDIS_PROBE_TTL_SECONDS"""
+    global _last_probe
+    probed_at, available = _last_probe
+    now = time.monotonic()
+    if now - probed_at < REDIS_PROBE_TTL_SECONDS:
+        return available
+    try:
+        available = bool(get_redis_connection().ping())
+    except redis.RedisError:
+        available = False
+    _last_probe = (now, available)
+    return available
+
+@functools.lru_cache(maxsize=1)
+def _analysis_queue():
+    return Queue('analysis', connection=get_redis_connection())
+
+def get_queue():
+    """Get the analysis queue, raising if Redis is not available"""
+    if not is_redis_available():
+        raise RuntimeError(f"Redis queue is not available at {REDIS_URL}")
+    return _analysis_queue()
+
+@ttl_cache(maxsize=1, ttl=2.0)
+def get_queue_counts():
+    """Get (pending, failed, finished) job counts in one round-trip, cached for dashboards polling.
+
+    Registry entries are scored by expiry time; the ones already expired (which RQ's
+    count would clean up first) are left out rather than removed here.
+    """
+    queue = get_queue()
+    now = time.time()
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.llen(queue.key)
+    for registry in (queue.failed_job_registry, queue.finished_job_registry):
+        pipe.zcard(registry.key)
+        pipe.zcount(registry.key, 0, now)
+    pending, failed, failed_expired, finished, finished_expired = pipe.execute()
+    return pending, failed - failed_expired, finished - finished_expired
+
+# Transient analysis progress lives in Redis so the worker doesn't need a DB write
+# for the "processing" transition; only the final state is persisted
+PROGRESS_TTL_SECONDS = 3600
+
+def _progress_keys(analysis_id):
+    return f"analysis:{analysis_id}:status", f"analysis:{analysis_id}:started_at"
+
+def set_analysis_progress(analysis_id, status, started_at):
+    """Record the in-flight status of an analysis"""
+    if not is_redis_available():
+        return
+    status_key, started_key = _progress_keys(analysis_id)
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.setex(status_key, PROGRESS_TTL_SECONDS, status)
+    pipe.setex(started_key, PROGRESS_TTL_SECONDS, started_at.isoformat())
+    pipe.execute()
+
+def get_analysis_progress(analysis_id):
+    """Get the in-flight (status, started_at) of an analysis, or None"""
+    if not is_redis_available():
+        return None
+    status, started_at = get_redis_connection().mget(_progress_keys(analysis_id))
+    if status is None:
+        return None
+    return status.decode(), datetime.fromisoformat(started_at.decode()) if started_at else None
+
+def clear_analysis_progress(analysis_id):
+    """Drop the in-flight status once the final state is in the database"""
+    if not is_redis_available():
+        return
+    get_redis_connection().delete(*_progress_keys(analysis_id))
+
+
+# Completed results keyed by (uploaded file hash, normalized query); lets the API
+# answer a repeat upload without queueing a job at all
+RESULT_CACHE_TTL_SECONDS = 86400
+
+def _result_key(file_sha256, query_norm):
+    return f"result:{file_sha256}:{hashlib.sha256(query_norm.encode()).hexdigest()}"
+
+def get_cached_result(file_sha256, query_norm):
+    """Get a cached analysis result dict, or None"""
+    if not is_redis_available():
+        return None
+    payload = get_redis_connection().get(_result_key(file_sha256, query_norm))
+    return orjson.loads(payload) if payload is not None else None
+
+def cache_result(file_sha256, query_norm, result):
+    """Cache a completed analysis result dict"""
+    if not is_redis_available():
+        return
+    get_redis_connection().setex(_result_key(file_sha256, query_norm), RESULT_CACHE_TTL_SECONDS, orjson.dumps(result))
+
+
+# Web search results, shared by all workers; agents of every job tend to repeat the same queries
+SEARCH_CACHE_TTL_SECONDS = 6 * 3600
+
+def _search_key(query_norm):
+    return f"search:{hashlib.sha1(query_norm.encode()).hexdigest()}"
+
+def get_cached_search(query_norm):
+    """Get the cached results text of a normalized search query, or None"""
+    if not is_redis_available():
+        return None
+    payload = get_redis_connection().get(_search_key(query_norm))
+    return payload.decode() if payload is not None else None
+
+def cache_search(query_norm, results):
+    """Cache the results text of a normalized search query"""
+    if not is_redis_available():
+        return
+    get_redis_connection().setex(_search_key(query_norm), SEARCH_CACHE_TTL_SECONDS, results)
+
+
+# Extracted document pages keyed by file content hash, so a re-uploaded document
+# (new path, same bytes) is not parsed again by another job
+DOCUMENT_CACHE_TTL_SECONDS = 3600
+
+def get_cached_document(file_sha256):
+    """Get the cached extracted pages (JSON text) of a document, or None"""
+    if not is_redis_available():
+        return None
+    payload = get_redis_connection().get(f"pdf:{file_sha256}")
+    return payload.decode() if payload is not None else None
+
+def cache_document(file_sha256, pages):
+    """Cache the extracted pages (JSON text) of a document"""
+    if not is_redis_available():
+        return
+    get_redis_connection().setex(f"pdf:{file_sha256}", DOCUMENT_CACHE_TTL_SECONDS, pages)
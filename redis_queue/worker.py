@@ -2,22 +2,108 @@
 Simple Redis Queue Worker for Financial Document Analyzer
 """
 
+import os
+import signal
+import argparse
+import multiprocessing
+import urllib.error
+import urllib.request
+from rq import Worker, SimpleWorker
+
 from .queue_config import get_queue, is_redis_available
+from .background_tasks import warm_up
+
+# RQ's Worker runs each job in a forked work horse; without fork (Windows) jobs run in-process
+CAN_FORK = hasattr(os, "fork")
+WORKER_CLASS = Worker if CAN_FORK else SimpleWorker
+
+def _run_worker():
+    """Run one worker process until it is shut down"""
+    warm_up()  # already done before forking; spawned processes load their own
+    queue = get_queue()
+    WORKER_CLASS([queue], connection=queue.connection).work()
+
+def _run_child_worker():
+    """Run a worker process started by start_worker, outside the parent's process group.
 
-def start_worker():
-    """Start the Redis queue worker"""
+    Terminal signals then reach only the parent, which forwards each one once; RQ treats
+    a second SIGINT/SIGTERM as a request for an immediate (cold) shutdown.
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    _run_worker()
+
+def _llm_endpoint_available():
+    """Check that the self-hosted LLM server (LLM_BASE_URL), if one is configured, is answering"""
+    from agents import LLM_BASE_URL
+    if not LLM_BASE_URL:
+        return True
+    request = urllib.request.Request(
+        f"{LLM_BASE_URL.rstrip('/')}/models",
+        headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY') or 'EMPTY'}"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5):
+            return True
+    except urllib.error.HTTPError as e:
+        # A 4xx (e.g. a key the probe can't satisfy) still means the server is up
+        if e.code < 500:
+            return True
+        print(f"❌ LLM endpoint {LLM_BASE_URL} returned HTTP {e.code}")
+        return False
+    except OSError as e:
+        print(f"❌ LLM endpoint {LLM_BASE_URL} is not reachable: {e}")
+        return False
+
+def start_worker(concurrency: int = 1):
+    """Start the Redis queue workers, one process each"""
     if not is_redis_available():
         print("❌ Redis is not available. Cannot start worker.")
         return
-    
-    queue = get_queue()
-    print("🚀 Starting Redis queue worker...")
+
+    # Agents, tools and LLM clients are built once here rather than in every job's work horse
+    print("🔥 Loading agents and tools...")
+    warm_up()
+    if not _llm_endpoint_available():
+        return
+
+    print(f"🚀 Starting {concurrency} Redis queue worker(s)...")
     print("📋 Queue: analysis")
     print("⏳ Waiting for jobs...")
+
+    if concurrency <= 1:
+        _run_worker()
+        return
+
+    context = multiprocessing.get_context("fork" if CAN_FORK else "spawn")
+    processes = [
+        context.Process(target=_run_child_worker, name=f"analysis-worker-{number}")
+        for number in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
     
-    # Start worker
-    worker = queue.worker()
-    worker.work()
+    def _forward_signal(signum, frame):
+        # docker stop / Kubernetes signal only PID 1; pass it on so each worker finishes its job
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+    
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, _forward_signal)
+    for process in processes:
+        process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Financial Document Analyzer queue workers")
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=int(os.getenv("WORKER_CONCURRENCY", "1")),
+        help="number of worker processes (default: WORKER_CONCURRENCY or 1)"
+    )
+    args = parser.parse_args()
+    start_worker(args.concurrency)
 
 if __name__ == "__main__":
-    start_worker()
+    main()
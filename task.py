@@ -3,9 +3,47 @@ from crewai import Task
 from agents import financial_analyst, verifier, investment_advisor, risk_assessor
 from tools import search_tool, read_financial_document
 
+# Tool lists shared by the tasks; web search is left out when it isn't configured
+DOCUMENT_TOOLS = [read_financial_document]
+COMMON_TOOLS = DOCUMENT_TOOLS + ([search_tool] if search_tool is not None else [])
+
+## Creating a document verification task
+verification = Task(
+    description="""Verify the authenticity, completeness, and accuracy of the uploaded financial document.
+    The document is located at: {file_path}
+    The document reader returns its financially relevant pages as JSON; cite page numbers for the figures you use.
+    
+    Verification checklist:
+    1. Document format and structure validation
+    2. Required financial statement components presence
+    3. Data consistency across different sections
+    4. Proper financial reporting standards compliance
+    5. Footnote and disclosure completeness
+    6. Signature and authorization verification (if applicable)
+    
+    Flag any inconsistencies or missing required elements.""",
+
+    expected_output="""Document verification report containing:
+    - Document Authentication Status
+    - Completeness Assessment (required sections present)
+    - Data Consistency Verification
+    - Compliance Standards Check
+    - Identified Issues or Discrepancies (if any)
+    - Overall Document Reliability Score
+    - Recommendations for additional verification if needed
+    
+    Provide clear pass/fail status with detailed explanations for any concerns.""",
+
+    agent=verifier,
+    tools=DOCUMENT_TOOLS,
+    async_execution=False
+)
+
 ## Creating a task to analyze financial documents
 analyze_financial_document = Task(
     description="""Conduct a comprehensive analysis of the financial document based on the user's query: {query}.
+    The document is located at: {file_path}
+    The document reader returns its financially relevant pages as JSON; cite page numbers for the figures you use.
     
     Your analysis should include:
     1. Extract and summarize key financial metrics (revenue, profit, cash flow, debt, assets)
@@ -29,13 +67,16 @@ analyze_financial_document = Task(
     All analysis must be factual, well-structured, and based on the actual document content.""",
 
     agent=financial_analyst,
-    tools=[read_financial_document, search_tool],
+    tools=COMMON_TOOLS,
+    context=[verification],
     async_execution=False,
 )
 
 ## Creating an investment analysis task
 investment_analysis = Task(
     description="""Analyze the financial document to provide professional investment insights based on the query: {query}.
+    The document is located at: {file_path}
+    The document reader returns its financially relevant pages as JSON; cite page numbers for the figures you use.
     
     Focus on:
     1. Evaluation of financial ratios and key performance indicators
@@ -60,13 +101,16 @@ investment_analysis = Task(
     Include appropriate disclaimers about investment risks and the need for professional advice.""",
 
     agent=investment_advisor,
-    # tools=[FinancialDocumentTool.read_data_tool, search_tool],
+    tools=COMMON_TOOLS,
+    context=[analyze_financial_document],
     async_execution=False,
 )
 
 ## Creating a risk assessment task
 risk_assessment = Task(
     description="""Conduct a thorough risk assessment of the company based on the financial document and user query: {query}.
+    The document is located at: {file_path}
+    The document reader returns its financially relevant pages as JSON; cite page numbers for the figures you use.
     
     Analyze:
     1. Financial risks (liquidity, credit, market, operational)
@@ -91,36 +135,7 @@ risk_assessment = Task(
     Provide actionable insights for risk management and monitoring.""",
 
     agent=risk_assessor,
-    tools=[read_financial_document, search_tool],
+    tools=COMMON_TOOLS,
+    context=[analyze_financial_document],
     async_execution=False,
 )
-    
-## Creating a document verification task
-verification = Task(
-    description="""Verify the authenticity, completeness, and accuracy of the uploaded financial document.
-    
-    Verification checklist:
-    1. Document format and structure validation
-    2. Required financial statement components presence
-    3. Data consistency across different sections
-    4. Proper financial reporting standards compliance
-    5. Footnote and disclosure completeness
-    6. Signature and authorization verification (if applicable)
-    
-    Flag any inconsistencies or missing required elements.""",
-
-    expected_output="""Document verification report containing:
-    - Document Authentication Status
-    - Completeness Assessment (required sections present)
-    - Data Consistency Verification
-    - Compliance Standards Check
-    - Identified Issues or Discrepancies (if any)
-    - Overall Document Reliability Score
-    - Recommendations for additional verification if needed
-    
-    Provide clear pass/fail status with detailed explanations for any concerns.""",
-
-    agent=verifier,
-    tools=[read_financial_document],
-    async_execution=False
-)
\ No newline at end of file
@@ -1,21 +1,231 @@
 ## Importing libraries and files
 import os
+import re
+import functools
+import orjson
+import threading
+import asyncio
+import importlib.util
 from dotenv import load_dotenv
 load_dotenv()
 
+import httpx
+from redis import RedisError
 from crewai.tools import tool  # Available in crewai.tools
-from langchain_community.document_loaders import PyPDFLoader
+from cache_keys import normalize_query, hash_file
+from redis_queue.queue_config import get_cached_search, cache_search, get_cached_document, cache_document
 
-## Creating search tool with API key
+## PDF text extraction with PyMuPDF (MuPDF's C parser), falling back to pypdfium2
 try:
-    from crewai_tools import SerperDevTool
-    search_tool = SerperDevTool()
-    print("✅ SerperDevTool initialized successfully")
+    import fitz  # PyMuPDF
+    PDF_LOADER_AVAILABLE = True
 except ImportError:
-    print("⚠️ crewai_tools not available, using fallback")
-    search_tool = None
-except Exception as e:
-    print(f"⚠️ SerperDevTool initialization failed: {e}")
+    PDF_LOADER_AVAILABLE = False
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+## Text patterns and keyword scanners, all built once at import
+# Matching is case-insensitive and substring-based ("liabilit" covers liability/liabilities)
+FINANCIAL_TERMS = ('revenue', 'income', 'profit', 'loss', 'earnings', 'cash', 'assets', 'liabilit',
+                   'debt', 'equity', 'margin', 'dividend', 'guidance', 'risk')
+INVESTMENT_KEYWORDS = ('revenue', 'profit', 'cash', 'earnings', 'debt', 'assets')
+RISK_KEYWORDS = ('debt', 'loss', 'decline', 'risk', 'uncertainty', 'challenge', 'competition')
+
+# Runs of two or more newlines, collapsed to one in a single pass
+_BLANK_LINES = re.compile(r"\n{2,}")
+# Whitespace runs within a line, and line breaks with the blank lines and spaces around them
+_INLINE_WHITESPACE = re.compile(r"[^\S\n]+")
+_LINE_BREAKS = re.compile(r" ?\n[\n ]*")
+
+def _keyword_pattern(keywords: tuple) -> re.Pattern:
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+# Pages mentioning none of the financial terms are dropped before the document reaches the LLM
+_FINANCIAL_TERMS = _keyword_pattern(FINANCIAL_TERMS)
+# One match per line that contains an investment keyword (from the line start to its first hit)
+_INVESTMENT_LINES = re.compile(
+    rf"^.*?(?:{_keyword_pattern(INVESTMENT_KEYWORDS).pattern})", re.IGNORECASE | re.MULTILINE
+)
+# Risk hits are found on the UTF-8 bytes: ASCII case folding covers the ASCII keywords
+# without the Unicode-aware matching a str pattern does for every character
+_RISK_KEYWORDS = re.compile(_keyword_pattern(RISK_KEYWORDS).pattern.encode(), re.IGNORECASE)
+
+def _build_automaton(keywords: tuple):
+    """Aho-Corasick automaton over lowercase keywords, or None without pyahocorasick"""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+def _build_hyperscan(keywords: tuple):
+    """Caseless Hyperscan block database reporting each keyword once, or None when unavailable"""
+    try:
+        import hyperscan
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[keyword.encode() for keyword in keywords],
+            ids=list(range(len(keywords))),
+            elements=len(keywords),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(keywords)
+        )
+        return database
+    except Exception:  # not installed, or no supported CPU (SIMD, x86 only)
+        return None
+
+# The risk scan prefers Hyperscan, then Aho-Corasick (one C-level pass each), then the regex
+_RISK_HYPERSCAN = _build_hyperscan(RISK_KEYWORDS)
+_RISK_AUTOMATON = _build_automaton(RISK_KEYWORDS)
+# A Hyperscan database's scratch space serves one scan at a time, and crews run concurrently
+_HYPERSCAN_LOCK = threading.Lock()
+
+def _on_risk_match(keyword_id, start, end, flags, found):
+    found.add(RISK_KEYWORDS[keyword_id])
+
+def _find_risk_keywords(text: str) -> set:
+    """Get the distinct risk keywords that occur in the text"""
+    if _RISK_AUTOMATON is not None and _RISK_HYPERSCAN is None:
+        # pyahocorasick's default build matches str keys only
+        return {keyword for _, keyword in _RISK_AUTOMATON.iter(text.lower())}
+    
+    # Hyperscan and the regex both match caselessly, so the text is encoded once and never lowercased
+    data = text.encode()
+    if _RISK_HYPERSCAN is not None:
+        found = set()
+        with _HYPERSCAN_LOCK:
+            _RISK_HYPERSCAN.scan(data, match_event_handler=_on_risk_match, context=found)
+        return found
+    return {match.group(0).lower().decode() for match in _RISK_KEYWORDS.finditer(data)}
+
+## Reading PDF pages
+def _read_pdf_pages(path: str) -> list:
+    """Get the raw text of each page; pypdfium2 retries files PyMuPDF can't parse"""
+    if PDF_LOADER_AVAILABLE:
+        try:
+            with fitz.open(path) as doc:
+                return [page.get_text("text") for page in doc]
+        except Exception:
+            if not PDFIUM_AVAILABLE:
+                raise
+
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return [page.get_textpage().get_text_range().replace("\r\n", "\n") for page in pdf]
+    finally:
+        pdf.close()
+
+@functools.lru_cache(maxsize=128)
+def _extract_document_pages(path: str, mtime_ns: int, size: int) -> str:
+    """Get the financially relevant pages of a PDF as a JSON array.
+
+    Memoized per (path, mtime, size) in this process, and shared between jobs through
+    Redis by content hash; only a miss in both parses the file.
+    """
+    content_hash = hash_file(path)
+    try:
+        cached = get_cached_document(content_hash)
+    except RedisError:
+        cached = None
+    if cached is not None:
+        return cached
+    
+    pages = []
+    for number, content in enumerate(_read_pdf_pages(path), start=1):
+        # Clean and format the financial document data: collapse runs of blank lines
+        text = _BLANK_LINES.sub("\n", content).strip()
+        if text:
+            pages.append({"page": number, "text": text})
+    
+    # Keep every page if the filter would leave nothing to analyze
+    relevant = [page for page in pages if _FINANCIAL_TERMS.search(page["text"])]
+    document = orjson.dumps(relevant or pages).decode()
+    try:
+        cache_document(content_hash, document)
+    except RedisError:
+        pass  # The parse itself succeeded
+    return document
+
+## Creating search tool with API key
+# Serper is called through one pooled async HTTP client on a background event loop, so
+# agents searching from parallel crews share connections and their requests overlap
+SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+SERPER_CONCURRENCY = int(os.getenv("SERPER_CONCURRENCY", "8"))
+SERPER_RESULTS = 10
+
+_SEARCH_RUNTIME_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _search_runtime(pid: int):
+    """Start the search event loop and HTTP client once per process (threads don't survive fork)"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="search-loop", daemon=True).start()
+    client = httpx.AsyncClient(
+        base_url="https://google.serper.dev",
+        headers={"X-API-KEY": SERPER_API_KEY},
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=15.0
+    )
+    return loop, client, asyncio.Semaphore(SERPER_CONCURRENCY)
+
+async def _serper_search(client, semaphore, query: str) -> dict:
+    async with semaphore:
+        response = await client.post("/search", json={"q": query, "num": SERPER_RESULTS})
+    response.raise_for_status()
+    return response.json()
+
+def _search(query: str) -> str:
+    """Run a Serper search from any thread and format the organic results"""
+    with _SEARCH_RUNTIME_LOCK:  # agents of parallel crews may make the first search together
+        loop, client, semaphore = _search_runtime(os.getpid())
+    results = asyncio.run_coroutine_threadsafe(_serper_search(client, semaphore, query), loop).result()
+    return "\n".join(
+        f"{result.get('title', '')} ({result.get('link', '')}): {result.get('snippet', '')}"
+        for result in results.get("organic", [])
+    ) or "No results found"
+
+@functools.lru_cache(maxsize=512)
+def _cached_search(query_norm: str) -> str:
+    """Search once per normalized query: this process's LRU first, then Redis, then Serper"""
+    try:
+        results = get_cached_search(query_norm)
+    except RedisError:
+        results = None
+    if results is None:
+        results = _search(query_norm)
+        try:
+            cache_search(query_norm, results)
+        except RedisError:
+            pass  # The search itself succeeded
+    return results
+
+@tool("Search the internet")
+def search_internet(search_query: str) -> str:
+    """Search the internet (Google, via Serper) for market data, news and company information.
+
+    Args:
+        search_query (str): The search query
+
+    Returns:
+        str: The top results, one per line: title (link): snippet
+    """
+    try:
+        return _cached_search(normalize_query(search_query))
+    except Exception as e:
+        return f"Error searching the internet: {str(e)}"
+
+if SERPER_API_KEY:
+    search_tool = search_internet
+    print("✅ Search tool initialized successfully")
+else:
+    print("⚠️ SERPER_API_KEY not set, web search disabled")
     search_tool = None
 
 ## Creating custom tools using @tool decorator
@@ -28,29 +238,17 @@ def read_financial_document(path: str = 'data/sample.pdf') -> str:
         path (str, optional): Path of the PDF file. Defaults to 'data/sample.pdf'.
 
     Returns:
-        str: Full content of the financial document
+        str: JSON array of {"page": number, "text": content} objects, one per page
+            with financial content (pages without any are left out)
     """
     try:
-        if PDF_LOADER_AVAILABLE:
-            # Load the PDF document using langchain
-            loader = PyPDFLoader(file_path=path)
-            docs = loader.load()
-
-            full_report = ""
-            for doc in docs:
-                # Clean and format the financial document data
-                content = doc.page_content
-
-                # Remove extra whitespaces and format properly
-                while "\n\n" in content:
-                    content = content.replace("\n\n", "\n")
-
-                full_report += content + "\n"
-
-            return full_report.strip()
+        if PDF_LOADER_AVAILABLE or PDFIUM_AVAILABLE:
+            # Every agent reads the same upload; the stat makes a rewritten file a cache miss
+            stat = os.stat(path)
+            return _extract_document_pages(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
         else:
             # Fallback: return placeholder text
-            return f"PDF file at {path} detected but langchain_community not available for processing. Please install langchain_community for full PDF reading functionality."
+            return f"PDF file at {path} detected but no PDF parser is available for processing. Please install PyMuPDF or pypdfium2 for full PDF reading functionality."
         
     except Exception as e:
         return f"Error reading PDF file: {str(e)}"
@@ -67,24 +265,13 @@ def analyze_investment_opportunities(financial_document_data: str) -> str:
     """
     try:
         # Process and analyze the financial document data
-        processed_data = financial_document_data.strip()
-
-        # Clean up the data format - remove excessive whitespace
-        lines = processed_data.split('\n')
-        cleaned_lines = []
-
-        for line in lines:
-            cleaned_line = ' '.join(line.split())  # Remove multiple spaces
-            if cleaned_line:  # Only add non-empty lines
-                cleaned_lines.append(cleaned_line)
-
-        processed_data = '\n'.join(cleaned_lines)
+        # Clean up the data format - collapse whitespace runs and drop empty lines
+        processed_data = _LINE_BREAKS.sub("\n", _INLINE_WHITESPACE.sub(" ", financial_document_data)).strip()
 
         # Basic investment analysis structure
         analysis = {
             "document_length": len(processed_data),
-            "key_sections_identified": len([line for line in cleaned_lines if any(keyword in line.lower()
-                for keyword in ['revenue', 'profit', 'cash', 'earnings', 'debt', 'assets'])]),
+            "key_sections_identified": sum(1 for _ in _INVESTMENT_LINES.finditer(processed_data)),
             "status": "Ready for detailed investment analysis"
         }
 
@@ -108,19 +295,11 @@ def assess_financial_risk(financial_document_data: str) -> str:
         processed_data = financial_document_data.strip()
 
         # Identify potential risk indicators in the text
-        risk_keywords = ['debt', 'loss', 'decline', 'risk', 'uncertainty', 'challenge', 'competition']
-        risk_indicators = []
-
-        lines = processed_data.lower().split('\n')
-        for line in lines:
-            for keyword in risk_keywords:
-                if keyword in line:
-                    risk_indicators.append(keyword)
-                    break
+        risk_indicators = _find_risk_keywords(processed_data)
 
         risk_assessment = {
-            "risk_indicators_found": len(set(risk_indicators)),
-            "document_sections_analyzed": len(lines),
+            "risk_indicators_found": len(risk_indicators),
+            "document_sections_analyzed": processed_data.count('\n') + 1,
             "risk_coverage": "Comprehensive risk analysis ready"
         }
 